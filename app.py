@@ -1,70 +1,231 @@
 import os
-import json
-from flask import Flask, request, jsonify, session
+import hashlib
+import orjson
+import tempfile
+from io import BytesIO
+from flask import Flask, request, jsonify, session, send_file
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import parse_form_data
 from werkzeug.utils import secure_filename
+from flask_session import Session
+from celery import Celery
+import redis
 import uuid
 from datetime import datetime
-from pdf_processor import PDFToStructuredData
+from pdf_processor import PDFToStructuredData, items_to_dataframe
 import secrets
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, so jsonify and request.json use the fast native parser"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 # In app.py, modify the CORS setup:
 CORS(app, supports_credentials=True, origins=["http://localhost:5173", "http://127.0.0.1:5173"], allow_headers=["Content-Type"], expose_headers=["Access-Control-Allow-Origin"])
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 
 
-# Configure session
-app.config['SESSION_TYPE'] = 'filesystem'  # This will store sessions on disk
+# Configure session - Redis gives sub-millisecond session reads/writes and
+# avoids the per-request file locking of the filesystem backend
+app.config['SESSION_TYPE'] = 'redis'
+app.config['SESSION_REDIS'] = redis.Redis(
+    host=os.environ.get('REDIS_HOST', 'localhost'),
+    port=int(os.environ.get('REDIS_PORT', 6379))
+)
 app.config['SESSION_PERMANENT'] = True  # Make sessions last longer
 app.config['PERMANENT_SESSION_LIFETIME'] = 3600  # Session lifetime in seconds
+Session(app)
 
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['PROCESSED_FOLDER'] = 'processed_data'
+app.config['CACHE_FOLDER'] = os.path.join('processed_data', '_cache')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 
-# Ensure upload and processed folders exist
+# Ensure upload, processed and cache folders exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
+os.makedirs(app.config['CACHE_FOLDER'], exist_ok=True)
+
+
+def file_sha256(file_path):
+    """Compute the SHA-256 digest of a file, reading in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_lookup(digest):
+    """Return the processed JSON path for a previously seen PDF digest, or None"""
+    cache_path = os.path.join(app.config['CACHE_FOLDER'], f"{digest}.json")
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, 'rb') as f:
+        entry = orjson.loads(f.read())
+    json_path = entry.get('json_path')
+    if json_path and os.path.exists(json_path):
+        return json_path
+    return None
+
+
+def cache_store(digest, json_path):
+    """Record the processed JSON path for a PDF digest"""
+    cache_path = os.path.join(app.config['CACHE_FOLDER'], f"{digest}.json")
+    with open(cache_path, 'wb') as f:
+        f.write(orjson.dumps({'json_path': json_path}))
+
+
+def data_id_for(json_path):
+    """Opaque client-facing ID for a processed data file (never the raw path)"""
+    return hashlib.sha256(json_path.encode('utf-8')).hexdigest()[:16]
+
+
+def shortlist_key():
+    """Redis key for the current session's shortlist set"""
+    return f"shortlist:{session.sid}"
+
+
+def get_shortlist():
+    """Return the current session's shortlist from its Redis set"""
+    r = app.config['SESSION_REDIS']
+    key = shortlist_key()
+    members = r.smembers(key)
+
+    # Flask-Session refreshes the session's TTL on every request; keep the
+    # shortlist on the same schedule by refreshing on reads, not just writes,
+    # so a long-lived session can't outlive its shortlist mid-use
+    if members:
+        r.expire(key, app.config['PERMANENT_SESSION_LIFETIME'])
+
+    # Item ids are ints assigned in process_pdf, but Redis hands members back
+    # as bytes - coerce numeric ids to int so clients get the type they stored
+    shortlist = []
+    for member in members:
+        value = member.decode('utf-8')
+        shortlist.append(int(value) if value.lstrip('-').isdigit() else value)
+
+    # Redis sets are unordered; sort numerically (ints before any stray
+    # string ids) so polling clients see a stable order
+    return sorted(shortlist, key=lambda v: (isinstance(v, str), v))
+
+
+# Shared processor: a single long-lived OpenAI client (thread-safe) keeps one
+# httpx connection pool, so TLS handshakes to api.openai.com amortize across
+# uploads instead of being paid per request
+PROCESSOR = PDFToStructuredData(output_dir=app.config['PROCESSED_FOLDER'])
+
+
+# Background task queue - run a worker with: celery -A app.celery worker
+celery = Celery(
+    'jc',
+    broker=os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
+    backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+)
+
+
+@celery.task
+def process_pdf_task(file_path, digest):
+    """Run the PDF -> LLM pipeline in the worker and cache the result"""
+    result = PROCESSOR.process_pdf(file_path)
+
+    if 'error' not in result:
+        json_path = result['output_files'].get('json')
+        if json_path and os.path.exists(json_path):
+            cache_store(digest, json_path)
+
+    return result
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle PDF upload and processing"""
-    if 'pdf_file' not in request.files:
+    # Spool the multipart body straight to disk as it arrives instead of
+    # letting Werkzeug buffer the whole file before we save it
+    unique_id = uuid.uuid4().hex
+    spool_paths = []
+
+    # Parsing the environ directly bypasses Flask's MAX_CONTENT_LENGTH
+    # enforcement, so apply the limit here: reject oversized declared bodies
+    # up front and cap the parser for chunked/undeclared ones
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length and request.content_length > max_length:
+        return jsonify({'error': 'File too large'}), 413
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        # One spool file per part, so multiple file fields can't clobber
+        # each other's bytes
+        spool = tempfile.NamedTemporaryFile(delete=False, suffix='.part',
+                                            dir=app.config['UPLOAD_FOLDER'])
+        spool_paths.append(spool.name)
+        return spool
+
+    def cleanup_spools():
+        for path in spool_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    try:
+        _, _, files = parse_form_data(request.environ, stream_factory=stream_factory,
+                                      max_content_length=max_length,
+                                      max_form_memory_size=1 << 20)
+    except RequestEntityTooLarge:
+        # A chunked body that blows the cap raises mid-read - it's an
+        # HTTPException, so the parser's silent=True doesn't swallow it
+        cleanup_spools()
+        return jsonify({'error': 'File too large'}), 413
+
+    if 'pdf_file' not in files:
+        cleanup_spools()
         return jsonify({'error': 'No file part'}), 400
-        
-    file = request.files['pdf_file']
-    
+
+    file = files['pdf_file']
+
     if file.filename == '':
+        cleanup_spools()
         return jsonify({'error': 'No selected file'}), 400
-        
+
     if file and file.filename.lower().endswith('.pdf'):
         # Generate unique filename
-        unique_id = uuid.uuid4().hex
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = secure_filename(f"{unique_id}_{timestamp}_{file.filename}")
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
+
         try:
-            # Save the uploaded file
-            file.save(file_path)
-            
-            # Process the PDF with our backend tool
-            processor = PDFToStructuredData(output_dir=app.config['PROCESSED_FOLDER'])
-            result = processor.process_pdf(file_path)
-            
-            if 'error' in result:
-                return jsonify({'error': result['error']}), 500
-                
-            # Get the path to the JSON file
-            json_path = result['output_files'].get('json')
-            
-            if not json_path or not os.path.exists(json_path):
-                return jsonify({'error': 'Failed to process PDF'}), 500
+            # The file bytes are already on disk; just move this part's
+            # spool file into place under its final name, then drop any
+            # spools left over from other file fields
+            spool_path = file.stream.name
+            file.stream.close()
+            os.replace(spool_path, file_path)
+            cleanup_spools()
+
+            # Check the cache first: identical PDFs (same rate list
+            # reuploaded) get the previously computed result with no LLM calls
+            digest = file_sha256(file_path)
+            json_path = cache_lookup(digest)
+
+            if json_path is None:
+                # Queue the PDF -> LLM pipeline on the worker and release
+                # this HTTP worker immediately; the frontend polls /api/task
+                task = process_pdf_task.delay(file_path, digest)
+                return jsonify({
+                    'success': True,
+                    'message': 'File uploaded. Processing started.',
+                    'task_id': task.id
+                }), 202
                 
-            # Read the JSON data
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Cache hit: read the previously computed JSON data
+            with open(json_path, 'rb') as f:
+                data = orjson.loads(f.read())
                 
             # Store the result path in session (still try this for other features)
             session['current_data_path'] = json_path
@@ -78,38 +239,114 @@ def upload_file():
                 'success': True,
                 'message': f'File processed successfully. Found {items_count} items.',
                 'data': data,
-                'data_path': json_path
+                'data_id': data_id_for(json_path)
             })
             
         except Exception as e:
+            cleanup_spools()
             return jsonify({'error': f'Error processing file: {str(e)}'}), 500
-    
+
+    cleanup_spools()
     return jsonify({'error': 'Invalid file format. Please upload a PDF file.'}), 400
 
+@app.route('/api/task/<task_id>', methods=['GET'])
+def task_status(task_id):
+    """Return the state of a background processing task, with data when done"""
+    task = process_pdf_task.AsyncResult(task_id)
+
+    if task.state == 'FAILURE':
+        return jsonify({'error': f'Processing failed: {str(task.result)}'}), 500
+
+    if task.state != 'SUCCESS':
+        # PENDING/STARTED/RETRY, or anything else (e.g. REVOKED) where
+        # task.result is not our result dict
+        return jsonify({'success': True, 'state': task.state})
+
+    result = task.result
+
+    if 'error' in result:
+        return jsonify({'error': result['error']}), 500
+
+    json_path = result['output_files'].get('json')
+
+    if not json_path or not os.path.exists(json_path):
+        return jsonify({'error': 'Failed to process PDF'}), 500
+
+    # The task result already carries the structured data in memory; no
+    # need to reopen and reparse the JSON file we just wrote
+    data = result['structured_data']
+
+    # Store the result path in session (still try this for other features)
+    session['current_data_path'] = json_path
+    session.modified = True
+
+    # Get item count
+    items_count = len(data.get("structured_data", {}).get("items", []))
+
+    return jsonify({
+        'success': True,
+        'state': task.state,
+        'message': f'File processed successfully. Found {items_count} items.',
+        'data': data,
+        'data_id': data_id_for(json_path)
+    })
+
 @app.route('/api/get-data', methods=['GET'])  # Added /api prefix
 def get_data():
-    """Return processed data for display"""
-    print("Hello from get_data")
+    """Serve the processed data file for display"""
     data_path = session.get('current_data_path')
-    print("data_path: ", data_path)
     if not data_path or not os.path.exists(data_path):
         return jsonify({'error': 'No processed data available'}), 404
-        
+
+    # The file is immutable once written, so hand it to Werkzeug: sendfile
+    # copies it kernel-side and conditional=True gives clients ETag /
+    # Last-Modified revalidation (304s instead of full transfers)
+    return send_file(data_path, mimetype='application/json',
+                     as_attachment=False, conditional=True)
+
+@app.route('/api/shortlist', methods=['GET'])
+def read_shortlist():
+    """Return the current shortlist"""
+    return jsonify({
+        'success': True,
+        'shortlist': get_shortlist()
+    })
+
+@app.route('/api/export/<fmt>', methods=['GET'])
+def export_data(fmt):
+    """Generate a CSV or Excel export of the current data on demand"""
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+
+    data_path = session.get('current_data_path')
+    if not data_path or not os.path.exists(data_path):
+        return jsonify({'error': 'No processed data available'}), 404
+
     try:
-        with open(data_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        # Get current shortlist
-        shortlist = session.get('shortlist', [])
-            
-        return jsonify({
-            'success': True,
-            'data': data,
-            'shortlist': shortlist
-        })
-        
+        with open(data_path, 'rb') as f:
+            data = orjson.loads(f.read())
+
+        items = data.get('structured_data', {}).get('items', [])
+        if not items:
+            return jsonify({'error': 'No items to export'}), 404
+
+        df = items_to_dataframe(items)
+        buf = BytesIO()
+
+        if fmt == 'csv':
+            df.to_csv(buf, index=False)
+            mimetype = 'text/csv'
+        else:
+            # xlsxwriter is noticeably faster than the default openpyxl writer
+            df.to_excel(buf, index=False, engine='xlsxwriter')
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+        buf.seek(0)
+        return send_file(buf, mimetype=mimetype, as_attachment=True,
+                         download_name=f'export.{fmt}')
+
     except Exception as e:
-        return jsonify({'error': f'Error loading data: {str(e)}'}), 500
+        return jsonify({'error': f'Error exporting data: {str(e)}'}), 500
 
 @app.route('/api/shortlist', methods=['POST'])  # Added /api prefix
 def update_shortlist():
@@ -117,25 +354,35 @@ def update_shortlist():
     data = request.json
     item_id = data.get('item_id')
     action = data.get('action')  # 'add' or 'remove'
-    
+
     if not item_id:
         return jsonify({'error': 'No item ID provided'}), 400
-        
-    # Get current shortlist
-    shortlist = session.get('shortlist', [])
-    
-    if action == 'add' and item_id not in shortlist:
-        shortlist.append(item_id)
-    elif action == 'remove' and item_id in shortlist:
-        shortlist.remove(item_id)
-        
-    # Update session
-    session['shortlist'] = shortlist
-    
+
+    # The shortlist is keyed by session.sid, but Flask-Session won't persist
+    # an empty session or set its cookie - an empty session would get a fresh
+    # sid every request and strand the set in an orphaned key. Put a marker in
+    # the session so the sid sticks before we key Redis off it.
+    if 'shortlist_active' not in session:
+        session['shortlist_active'] = True
+    session.permanent = True
+
+    # Redis set ops are O(1) and atomic, so concurrent clicks can't race a
+    # read-modify-write the way the old session list did
+    r = app.config['SESSION_REDIS']
+    key = shortlist_key()
+
+    if action == 'add':
+        r.sadd(key, item_id)
+    elif action == 'remove':
+        r.srem(key, item_id)
+
+    r.expire(key, app.config['PERMANENT_SESSION_LIFETIME'])
+
     return jsonify({
         'success': True,
-        'shortlist': shortlist
+        'shortlist': get_shortlist()
     })
 
 if __name__ == '__main__':
+    # Development only - in production run: gunicorn -c gunicorn.conf.py app:app
     app.run(debug=True, port=5000)
\ No newline at end of file
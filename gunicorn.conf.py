@@ -0,0 +1,15 @@
+"""
+Gunicorn configuration for production.
+
+Run with: gunicorn -c gunicorn.conf.py app:app
+
+The gevent worker class monkey-patches the stdlib so the dominant wait
+(OpenAI HTTP round-trips) cooperatively yields, letting many concurrent
+uploads share each worker instead of blocking it.
+"""
+import os
+
+bind = '0.0.0.0:5000'
+worker_class = 'gevent'
+workers = os.cpu_count()
+worker_connections = 100